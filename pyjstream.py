@@ -1,3 +1,11 @@
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from enum import Enum, IntEnum
 
 
@@ -8,6 +16,7 @@ class TokenType(Enum):
     BOOLEAN = 3
     NULL = 4
     BUFFER_READ = 5
+    STREAM_RESET = 6
 
 
 class _Operators(IntEnum):
@@ -70,20 +79,145 @@ class _TokenizerState(Enum):
     UNICODE_6 = 27
 
 
+class JsonLimitExceeded(ValueError):
+    def __init__(self, limit, value, position):
+        super().__init__("JSON {0} limit of {1} exceeded at byte {2}".format(limit, value, position))
+        self.limit = limit
+        self.value = value
+        self.position = position
+
+    def __reduce__(self):
+        return JsonLimitExceeded, (self.limit, self.value, self.position)
+
+
+class JsonSourceError(Exception):
+    def __init__(self, source, error):
+        super().__init__("Failed to parse {0!r}: {1}".format(source, error))
+        self.source = source
+        self.error = error
+
+
+class _FollowState(Enum):
+    DATA = 0
+    RESET = 1
+    IDLE = 2
+
+
 class JsonTokenize(object):
-    def __init__(self, stream, buffer_events=False):
+    def __init__(self, stream, buffer_events=False, follow=False, poll_interval=0.1, idle_timeout=None, offset=0,
+                 max_depth=None, max_token_length=None, max_container_size=None, max_total_bytes=None):
         self.__stream = stream
         self.__buffer_events = buffer_events
-        self.__total_read = 0
+        for name, limit in (('max_depth', max_depth), ('max_token_length', max_token_length),
+                            ('max_container_size', max_container_size), ('max_total_bytes', max_total_bytes)):
+            if limit is not None and limit < 1:
+                raise ValueError("{0} must be at least 1, got {1}".format(name, limit))
+
+        self.__max_depth = max_depth
+        self.__max_token_length = max_token_length
+        self.__max_container_size = max_container_size
+        self.__max_total_bytes = max_total_bytes
+        self.__follow = follow
+        self.__poll_interval = poll_interval
+        self.__idle_timeout = idle_timeout
+        self.__total_read = offset
         self.__buffer_index = 0
+        # Stream reopened after a rotation, owned and closed by the tokenizer, unlike the caller's stream
+        self.__opened_stream = None
+
+        if offset:
+            stream.seek(offset)
 
     @property
     def position(self):
         return self.__total_read + self.__buffer_index
 
-    def tokenize(self):
+    def __limit_exceeded(self, limit, value, position=None):
+        return JsonLimitExceeded(limit, value, self.position if position is None else position)
+
+    def __stream_replaced(self):
+        # Detects a rotated (renamed and recreated) or truncated file behind the stream.
+        # Streams without a backing file (pipes, sockets, BytesIO) are never considered replaced.
         stream = self.__stream
+        try:
+            fd_stat = os.fstat(stream.fileno())
+            offset = stream.tell()
+            if fd_stat.st_size < offset:
+                stream.seek(0)
+                return True
+
+            if not isinstance(stream.name, str):
+                return False
+
+            path_stat = os.stat(stream.name)
+        except (AttributeError, OSError, ValueError):
+            return False
+
+        if (path_stat.st_ino, path_stat.st_dev) == (fd_stat.st_ino, fd_stat.st_dev):
+            return False
+
+        if fd_stat.st_size > offset:
+            # Drain whatever was appended to the old file before switching over
+            return False
+
+        self.__close_opened_stream()
+        self.__stream = self.__opened_stream = open(stream.name, 'rb')
+        return True
+
+    def __close_opened_stream(self):
+        if self.__opened_stream is not None:
+            self.__opened_stream.close()
+            self.__opened_stream = None
+
+    def __wait_for_data(self, deadline):
+        if deadline is not None and time.monotonic() >= deadline:
+            return _FollowState.IDLE
+
+        time.sleep(self.__poll_interval)
+
+        if self.__stream_replaced():
+            return _FollowState.RESET
+
+        return _FollowState.DATA
+
+    def __read(self, read_size):
+        # Returns the next buffer and whether the stream was reset, in follow mode an empty read waits for more data
+        # and yields a STREAM_RESET token when the file was rotated or truncated in the meantime
+        chars = self.__stream.read(read_size)
+        reset = False
+        if not self.__follow or chars:
+            return chars, reset
+
+        idle_timeout = self.__idle_timeout
+        deadline = None if idle_timeout is None else time.monotonic() + idle_timeout
+        while not chars:
+            state = self.__wait_for_data(deadline)
+            if state == _FollowState.IDLE:
+                break
+
+            if state == _FollowState.RESET:
+                reset = True
+                self.__total_read = 0
+                self.__buffer_index = 0
+                yield (TokenType.STREAM_RESET, None)
+
+            chars = self.__stream.read(read_size)
+
+        return chars, reset
+
+    def tokenize(self):
+        try:
+            yield from self.__tokenize()
+        finally:
+            self.__close_opened_stream()
+
+    def __tokenize(self):
         buffer_events = self.__buffer_events
+        # max_token_length bounds the decoded length of a string (escapes already resolved) or the length of a number,
+        # a violation is reported at the byte where the offending token starts.
+        # Unset limits become sys.maxsize so the hot loop only ever does a single integer comparison
+        max_token_length = sys.maxsize if self.__max_token_length is None else self.__max_token_length
+        max_total_bytes = sys.maxsize if self.__max_total_bytes is None else self.__max_total_bytes
 
         def is_delimiter(char):
             return char in b" \t\n{}[]:,"
@@ -92,12 +226,20 @@ class JsonTokenize(object):
         local_char_code = bytearray()
 
         processor = _TokenizerState.WHITESPACE
-        buffer_size = 1024 * 1024
-        chars = stream.read(buffer_size)
+        token_start = 0
+        read_size = buffer_size = 1024 * 1024
+        eof = False
+        # Bytes read by this tokenizer, independent of the resume offset and of resets in follow mode
+        consumed = 0
+        chars, _ = yield from self.__read(read_size)
 
         while chars:
             self.__buffer_index = 0
 
+            if consumed + len(chars) > max_total_bytes and not eof:
+                self.__buffer_index = max_total_bytes - consumed
+                raise self.__limit_exceeded('max_total_bytes', max_total_bytes)
+
             l = len(chars)
             while self.__buffer_index < l:
                 char = chars[self.__buffer_index]
@@ -105,6 +247,9 @@ class JsonTokenize(object):
                 if processor == _TokenizerState.STRING:
                     if char == _Operators.DOUBLE_QUOTES:
                         self.__buffer_index += 1
+                        if len(current_token) > max_token_length:
+                            raise self.__limit_exceeded('max_token_length', max_token_length, token_start)
+
                         yield (TokenType.STRING, current_token)
                         current_token = bytearray()
                         processor = _TokenizerState.STRING_END
@@ -130,23 +275,27 @@ class JsonTokenize(object):
                         continue
 
                     if char == _Operators.DOUBLE_QUOTES:
+                        token_start = self.__total_read + self.__buffer_index
                         self.__buffer_index += 1
                         processor = _TokenizerState.STRING
                         continue
 
                     if char in b"123456789":
+                        token_start = self.__total_read + self.__buffer_index
                         processor = _TokenizerState.INTEGER
                         current_token.append(char)
                         self.__buffer_index += 1
                         continue
 
                     if char == _Operators.ZERO:
+                        token_start = self.__total_read + self.__buffer_index
                         processor = _TokenizerState.INTEGER_0
                         current_token.append(char)
                         self.__buffer_index += 1
                         continue
 
                     if char == _Operators.MINUS:
+                        token_start = self.__total_read + self.__buffer_index
                         processor = _TokenizerState.INTEGER_SIGN
                         current_token.append(char)
                         self.__buffer_index += 1
@@ -281,6 +430,9 @@ class JsonTokenize(object):
                     if is_delimiter(char):
                         self.__buffer_index += 0
                         processor = _TokenizerState.WHITESPACE
+                        if len(current_token) > max_token_length:
+                            raise self.__limit_exceeded('max_token_length', max_token_length, token_start)
+
                         yield (TokenType.NUMBER, int(current_token))
                         current_token = bytearray()
                         continue
@@ -320,6 +472,9 @@ class JsonTokenize(object):
                     if is_delimiter(char):
                         processor = _TokenizerState.WHITESPACE
                         self.__buffer_index += 0
+                        if len(current_token) > max_token_length:
+                            raise self.__limit_exceeded('max_token_length', max_token_length, token_start)
+
                         yield (TokenType.NUMBER, float(current_token))
                         current_token = bytearray()
                         continue
@@ -340,6 +495,9 @@ class JsonTokenize(object):
 
                     if is_delimiter(char):
                         self.__buffer_index += 0
+                        if len(current_token) > max_token_length:
+                            raise self.__limit_exceeded('max_token_length', max_token_length, token_start)
+
                         yield (TokenType.NUMBER, float(current_token))
                         current_token = bytearray()
                         processor = _TokenizerState.WHITESPACE
@@ -505,17 +663,29 @@ class JsonTokenize(object):
                     self.__buffer_index += 1
                     continue
 
-            if chars == b' ':
+            if len(current_token) > max_token_length:
+                raise self.__limit_exceeded('max_token_length', max_token_length, token_start)
+
+            if eof:
+                # The synthetic delimiter is not part of the input, keep position at the real end for resuming
+                self.__buffer_index = 0
                 break
 
             if buffer_events:
                 yield (TokenType.BUFFER_READ, buffer_size)
 
             self.__total_read += len(chars)
-            chars = stream.read(buffer_size)
+            consumed += len(chars)
+            chars, reset = yield from self.__read(read_size)
+            if reset:
+                current_token = bytearray()
+                processor = _TokenizerState.WHITESPACE
+
             buffer_size = len(chars)
 
             if not chars:
+                # Feed a trailing delimiter so a number at the very end of the input is flushed
+                eof = True
                 chars = b' '
 
         if buffer_events:
@@ -523,9 +693,18 @@ class JsonTokenize(object):
 
     def yajl_events(self):
         stack = []
+        # Operators are yielded once the tokenizer has moved past them, hence the position - 1 in limit errors.
+        # Separator count of every open container, the root is exempt since it is never held in memory
+        sizes = []
+        max_depth = sys.maxsize if self.__max_depth is None else self.__max_depth
+        max_container_size = sys.maxsize if self.__max_container_size is None else self.__max_container_size
         pending_value = False
         for token, value in self.tokenize():
             if token == TokenType.STRING:
+                if stack and stack[-1] == _JSONCompositeType.ARRAY:
+                    yield (JSONStreamerEvents.ELEMENT_EVENT, value.decode('utf-8'))
+                    continue
+
                 if not pending_value:
                     yield (JSONStreamerEvents.KEY_EVENT, value.decode('utf-8'))
                     continue
@@ -547,25 +726,35 @@ class JsonTokenize(object):
 
             if token == TokenType.OPERATOR:
                 if value == _Operators.LEFT_BRACKET:
+                    if len(stack) >= max_depth:
+                        raise self.__limit_exceeded('max_depth', max_depth, self.position - 1)
+
                     yield (JSONStreamerEvents.OBJECT_START_EVENT, None)
                     stack.append(_JSONCompositeType.OBJECT)
+                    sizes.append(0)
                     pending_value = False
                     continue
 
                 if value == _Operators.RIGHT_BRACKET:
                     stack.pop()
+                    sizes.pop()
                     yield (JSONStreamerEvents.OBJECT_END_EVENT, None)
                     pending_value = False
                     continue
 
                 if value == _Operators.RIGHT_BRACE:
                     stack.pop()
+                    sizes.pop()
                     yield (JSONStreamerEvents.ARRAY_END_EVENT, None)
                     pending_value = False
                     continue
 
                 if value == _Operators.LEFT_BRACE:
+                    if len(stack) >= max_depth:
+                        raise self.__limit_exceeded('max_depth', max_depth, self.position - 1)
+
                     stack.append(_JSONCompositeType.ARRAY)
+                    sizes.append(0)
                     yield (JSONStreamerEvents.ARRAY_START_EVENT, None)
                     continue
 
@@ -574,6 +763,11 @@ class JsonTokenize(object):
                     continue
 
                 if value == _Operators.COMMA:
+                    if len(sizes) > 1:
+                        sizes[-1] += 1
+                        if sizes[-1] >= max_container_size:
+                            raise self.__limit_exceeded('max_container_size', max_container_size, self.position - 1)
+
                     if stack[-1] == _JSONCompositeType.OBJECT:
                         pending_value = False
 
@@ -585,6 +779,13 @@ class JsonTokenize(object):
                 yield (JSONStreamerEvents.BUFFER_READ, value)
                 continue
 
+            if token == TokenType.STREAM_RESET:
+                stack = []
+                sizes = []
+                pending_value = False
+                yield (JSONStreamerEvents.STREAM_RESET, None)
+                continue
+
             raise Exception('unknown token %s', token)
 
 
@@ -602,8 +803,9 @@ class JSONStreamerEvents(Enum):
     ARRAY_END_EVENT = 6
     KEY_EVENT = 7
     VALUE_EVENT = 8
-    ELEMENT_EVENT = 8
+    ELEMENT_EVENT = 9
     BUFFER_READ = 10
+    STREAM_RESET = 11
 
 
 class _JSONCompositeType(Enum):
@@ -619,9 +821,12 @@ class ObjectStreamerEvents(Enum):
     PAIR_EVENT = 5
     ELEMENT_EVENT = 6
     BUFFER_READ = 10
+    STREAM_RESET = 11
 
 
-def yajl_object_streamer(gen):
+def yajl_object_streamer(gen, multiple_values=False):
+    # With multiple_values every top-level value is streamed in turn (NDJSON, follow mode)
+    # instead of stopping after the first one
     root = None
     obj_stack = []
     key_stack = []
@@ -671,14 +876,17 @@ def yajl_object_streamer(gen):
                 yield from _process_deep_entities()
             else:
                 yield (ObjectStreamerEvents.OBJECT_STREAM_END_EVENT, None)
-                break
+                if not multiple_values:
+                    break
+
+                root = None
 
             continue
 
         if event == JSONStreamerEvents.ARRAY_START_EVENT:
             if root is None:
                 root = _JSONCompositeType.ARRAY
-                yield (ObjectStreamerEvents.ARRAY_START_EVENT, None)
+                yield (ObjectStreamerEvents.ARRAY_STREAM_START_EVENT, None)
             else:
                 obj_stack.append([])
 
@@ -689,7 +897,10 @@ def yajl_object_streamer(gen):
                 yield from _process_deep_entities()
             else:
                 yield (ObjectStreamerEvents.ARRAY_STREAM_END_EVENT, None)
-                break
+                if not multiple_values:
+                    break
+
+                root = None
 
             continue
 
@@ -717,3 +928,130 @@ def yajl_object_streamer(gen):
         if event == JSONStreamerEvents.BUFFER_READ:
             yield (ObjectStreamerEvents.BUFFER_READ, value)
             continue
+
+        if event == JSONStreamerEvents.STREAM_RESET:
+            root = None
+            obj_stack = []
+            key_stack = []
+            yield (ObjectStreamerEvents.STREAM_RESET, None)
+            continue
+
+
+def _put_batch(out, cancelled, item):
+    # Never block forever on a full queue, the consumer may have gone away
+    while not cancelled.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+
+    return False
+
+
+def _parse_source(index, source, out, cancelled, objects, multiple_values, batch_size, tokenizer_args):
+    def put(batch, done, error=None):
+        return _put_batch(out, cancelled, (index, batch, done, error))
+
+    try:
+        stream = open(source, 'rb') if isinstance(source, (str, bytes, os.PathLike)) else source
+        try:
+            events = JsonTokenize(stream, **tokenizer_args).yajl_events()
+            if objects:
+                events = yajl_object_streamer(events, multiple_values)
+
+            batch = []
+            for event in events:
+                batch.append(event)
+                if len(batch) >= batch_size:
+                    if not put(batch, False):
+                        return
+
+                    batch = []
+        finally:
+            if stream is not source:
+                stream.close()
+    except Exception as e:
+        put([], True, e)
+        return
+
+    put(batch, True)
+
+
+def multi_source_streamer(sources, objects=True, multiple_values=True, ordered=False, processes=False, max_workers=None,
+                          queue_size=64, batch_size=1024, **tokenizer_args):
+    # Sources are paths or binary streams, streams are only supported with threads since they cannot be pickled.
+    # Yields (source, event) where event comes from yajl_object_streamer, or yajl_events when objects is False.
+    # multiple_values streams every top-level value of a source (NDJSON) rather than only the first one.
+    sources = list(sources)
+    max_workers = max_workers or os.cpu_count() or 1
+
+    if processes:
+        for source in sources:
+            if not isinstance(source, (str, bytes, os.PathLike)):
+                raise TypeError("Only paths can be parsed with processes=True, got {0!r}".format(source))
+
+    manager = None
+    if processes:
+        manager = multiprocessing.Manager()
+        executor = ProcessPoolExecutor(max_workers)
+        make_queue = manager.Queue
+        cancelled = manager.Event()
+    else:
+        executor = ThreadPoolExecutor(max_workers)
+        make_queue = queue.Queue
+        cancelled = threading.Event()
+
+    def submit(index, out):
+        def report_failure(future):
+            # A worker that could not start or was killed never reports on its queue, do it on its behalf
+            if not future.cancelled() and future.exception() is not None:
+                _put_batch(out, cancelled, (index, [], True, future.exception()))
+
+        future = executor.submit(_parse_source, index, sources[index], out, cancelled, objects, multiple_values,
+                                 batch_size, tokenizer_args)
+        future.add_done_callback(report_failure)
+
+    def receive(out):
+        index, batch, done, error = out.get()
+        if error is not None:
+            raise JsonSourceError(sources[index], error) from error
+
+        for event in batch:
+            yield sources[index], event
+
+        return done
+
+    try:
+        if ordered:
+            # Only max_workers sources are in flight, each with its own bounded queue, drained in source order
+            pending = deque()
+            for index in range(len(sources)):
+                out = make_queue(queue_size)
+                submit(index, out)
+                pending.append(out)
+                if len(pending) < max_workers:
+                    continue
+
+                out = pending.popleft()
+                while not (yield from receive(out)):
+                    pass
+
+            while pending:
+                out = pending.popleft()
+                while not (yield from receive(out)):
+                    pass
+        else:
+            out = make_queue(queue_size)
+            for index in range(len(sources)):
+                submit(index, out)
+
+            remaining = len(sources)
+            while remaining:
+                if (yield from receive(out)):
+                    remaining -= 1
+    finally:
+        cancelled.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        if manager is not None:
+            manager.shutdown()
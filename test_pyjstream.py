@@ -0,0 +1,277 @@
+import io
+import os
+import pickle
+import threading
+import time
+
+import pytest
+
+from pyjstream import (JsonLimitExceeded, JsonSourceError, JsonTokenize, JSONStreamerEvents, ObjectStreamerEvents,
+                       multi_source_streamer, yajl_object_streamer)
+
+
+def _events(data, **kwargs):
+    return list(JsonTokenize(io.BytesIO(data), **kwargs).yajl_events())
+
+
+def _later(*steps):
+    def run():
+        for step in steps:
+            time.sleep(0.2)
+            step()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _append(path, data):
+    def step():
+        with open(path, 'ab') as f:
+            f.write(data)
+
+    return step
+
+
+def _replace(path, data):
+    def step():
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    return step
+
+
+def _rotate(path, data):
+    def step():
+        os.rename(path, str(path) + '.1')
+        _replace(path, data)()
+
+    return step
+
+
+def _follow(path, **kwargs):
+    with open(path, 'rb') as stream:
+        tokenizer = JsonTokenize(stream, follow=True, poll_interval=0.01, idle_timeout=0.6, **kwargs)
+        events = [e for e in tokenizer.yajl_events() if e[0] != JSONStreamerEvents.OBJECT_START_EVENT]
+        return events, stream.closed
+
+
+def _values(events):
+    return [value for event, value in events if event == JSONStreamerEvents.VALUE_EVENT]
+
+
+def test_follow_appended_data(tmp_path):
+    path = tmp_path / 'log.ndjson'
+    path.write_bytes(b'{"a": 1}\n')
+    thread = _later(_append(path, b' '), _append(path, b'{"b": 2}\n{"c"'), _append(path, b': 3}\n'))
+    events, closed = _follow(path)
+    thread.join()
+
+    assert _values(events) == [1, 2, 3]
+    assert not closed
+
+
+def test_follow_empty_file(tmp_path):
+    path = tmp_path / 'log.ndjson'
+    path.write_bytes(b'')
+    thread = _later(_append(path, b'{"a": 1}\n'))
+    events, _ = _follow(path)
+    thread.join()
+
+    assert _values(events) == [1]
+
+
+def test_follow_resume_at_end_of_file(tmp_path):
+    path = tmp_path / 'log.ndjson'
+    path.write_bytes(b'{"a": 1}\n')
+    thread = _later(_append(path, b'{"b": 2}\n'))
+    events, _ = _follow(path, offset=os.path.getsize(path))
+    thread.join()
+
+    assert _values(events) == [2]
+
+
+def test_follow_rotation_and_truncation(tmp_path):
+    path = tmp_path / 'log.ndjson'
+    path.write_bytes(b'{"a": 1}\n')
+    thread = _later(_rotate(path, b'{"b": 2}\n'), _replace(path, b'{"c":3}\n'))
+    events, closed = _follow(path)
+    thread.join()
+
+    assert _values(events) == [1, 2, 3]
+    assert [e for e, _ in events].count(JSONStreamerEvents.STREAM_RESET) == 2
+    assert not closed
+
+
+def test_follow_closes_reopened_streams(tmp_path):
+    path = tmp_path / 'log.ndjson'
+    path.write_bytes(b'{"a": 1}\n')
+    before = len(os.listdir('/proc/self/fd')) if os.path.isdir('/proc/self/fd') else None
+    thread = _later(_rotate(path, b'{"b": 2}\n'), _rotate(path, b'{"c": 3}\n'))
+    _follow(path)
+    thread.join()
+
+    if before is not None:
+        assert len(os.listdir('/proc/self/fd')) == before
+
+
+def test_resume_offset_position():
+    data = b'{"a": 1}\n{"b": 2}\n'
+    tokenizer = JsonTokenize(io.BytesIO(data), offset=9)
+    assert list(tokenizer.yajl_events())[1] == (JSONStreamerEvents.KEY_EVENT, 'b')
+    assert tokenizer.position == len(data)
+
+
+def test_trailing_number_is_flushed():
+    tokens = list(JsonTokenize(io.BytesIO(b'12')).tokenize())
+    assert [value for _, value in tokens] == [12]
+
+
+def test_object_streamer_multiple_values():
+    data = b'{"a": 1}\n{"b": {"c": 2}}\n'
+    single = list(yajl_object_streamer(JsonTokenize(io.BytesIO(data)).yajl_events()))
+    multiple = list(yajl_object_streamer(JsonTokenize(io.BytesIO(data)).yajl_events(), multiple_values=True))
+
+    pairs = [value for event, value in multiple if event == ObjectStreamerEvents.PAIR_EVENT]
+    assert [value for event, value in single if event == ObjectStreamerEvents.PAIR_EVENT] == [('a', 1)]
+    assert pairs == [('a', 1), ('b', {'c': 2})]
+
+
+@pytest.mark.parametrize('data, limits, limit, position', [
+    (b'{"a": {"b": 1}}', {'max_depth': 1}, 'max_depth', 6),
+    (b'[[[[1]]]]', {'max_depth': 3}, 'max_depth', 3),
+    (b'[[1,2]]', {'max_container_size': 1}, 'max_container_size', 3),
+    (b'["' + b'a' * 100 + b'"]', {'max_token_length': 10}, 'max_token_length', 1),
+    (b'["' + b'a' * (2 * 1024 * 1024) + b'"]', {'max_token_length': 10}, 'max_token_length', 1),
+    (b'{"k": 12345678901}', {'max_token_length': 10}, 'max_token_length', 6),
+    (b'[1,2,3,4]', {'max_total_bytes': 5}, 'max_total_bytes', 5),
+])
+def test_limit_exceeded(data, limits, limit, position):
+    with pytest.raises(JsonLimitExceeded) as info:
+        _events(data, **limits)
+
+    assert info.value.limit == limit
+    assert info.value.position == position
+
+
+@pytest.mark.parametrize('data, limits', [
+    (b'[[[1]]]', {'max_depth': 3}),
+    (b'[[1,2]]', {'max_container_size': 2}),
+    (b'[1,2,3,4,5,6]', {'max_container_size': 2}),
+    (b'["aaaaa", 12345]', {'max_token_length': 5}),
+    (b'[1,2,3,4]', {'max_total_bytes': 9}),
+])
+def test_within_limits(data, limits):
+    assert _events(data, **limits)
+
+
+def test_limits_below_one_are_rejected():
+    with pytest.raises(ValueError):
+        JsonTokenize(io.BytesIO(b'[[1]]'), max_depth=0)
+
+
+def test_total_bytes_counted_from_offset():
+    data = b' ' * 100 + b'[1,2,3,4]'
+    assert _events(data, offset=100, max_total_bytes=50)
+
+    with pytest.raises(JsonLimitExceeded) as info:
+        _events(data, offset=100, max_total_bytes=5)
+
+    assert info.value.position == 105
+
+
+def test_limit_error_pickles():
+    error = pickle.loads(pickle.dumps(JsonLimitExceeded('max_depth', 3, 7)))
+    assert (error.limit, error.value, error.position) == ('max_depth', 3, 7)
+
+
+def test_object_streamer_nested_arrays():
+    data = b'{"x": [{"a": [1, "s"]}, 2], "y": "z"}'
+    events = list(yajl_object_streamer(JsonTokenize(io.BytesIO(data)).yajl_events()))
+
+    assert events == [
+        (ObjectStreamerEvents.OBJECT_STREAM_START_EVENT, None),
+        (ObjectStreamerEvents.PAIR_EVENT, ('x', [{'a': [1, 's']}, 2])),
+        (ObjectStreamerEvents.PAIR_EVENT, ('y', 'z')),
+        (ObjectStreamerEvents.OBJECT_STREAM_END_EVENT, None),
+    ]
+
+
+def test_object_streamer_root_array():
+    data = b'[{"a": 1}, "s", [2]]'
+    events = list(yajl_object_streamer(JsonTokenize(io.BytesIO(data)).yajl_events()))
+
+    assert events == [
+        (ObjectStreamerEvents.ARRAY_STREAM_START_EVENT, None),
+        (ObjectStreamerEvents.ELEMENT_EVENT, {'a': 1}),
+        (ObjectStreamerEvents.ELEMENT_EVENT, 's'),
+        (ObjectStreamerEvents.ELEMENT_EVENT, [2]),
+        (ObjectStreamerEvents.ARRAY_STREAM_END_EVENT, None),
+    ]
+
+
+def test_multi_source_ndjson(tmp_path):
+    path = tmp_path / 'nd.json'
+    path.write_bytes(b'{"a": 1}\n{"b": 2}\n')
+    events = list(multi_source_streamer([str(path)]))
+
+    assert [value for _, (event, value) in events if event == ObjectStreamerEvents.PAIR_EVENT] == [('a', 1), ('b', 2)]
+
+
+@pytest.fixture
+def json_files(tmp_path):
+    paths = []
+    for i in range(8):
+        path = tmp_path / '{0:02}.json'.format(i)
+        path.write_bytes('{{"id": {0}, "items": [{1}]}}'.format(i, ', '.join(['{"n": 1}'] * 200)).encode())
+        paths.append(str(path))
+
+    return paths
+
+
+@pytest.mark.parametrize('processes', [False, True])
+@pytest.mark.parametrize('ordered', [False, True])
+def test_multi_source(json_files, processes, ordered):
+    events = list(multi_source_streamer(json_files, ordered=ordered, processes=processes, max_workers=3, queue_size=1,
+                                        batch_size=1))
+    ids = [value[1] for _, (event, value) in events if event == ObjectStreamerEvents.PAIR_EVENT and value[0] == 'id']
+
+    assert sorted(ids) == list(range(len(json_files)))
+    assert len(events) == 4 * len(json_files)
+    if ordered:
+        assert ids == list(range(len(json_files)))
+        assert [source for source, _ in events] == sorted(source for source, _ in events)
+
+
+def test_multi_source_streams():
+    events = list(multi_source_streamer([io.BytesIO(b'{"a": 1}')]))
+    assert [event for _, (event, _) in events][1:2] == [ObjectStreamerEvents.PAIR_EVENT]
+
+
+@pytest.mark.parametrize('processes', [False, True])
+def test_multi_source_error_names_source(tmp_path, json_files, processes):
+    bad = tmp_path / 'bad.json'
+    bad.write_bytes(b'{"a": [[[1]]]}')
+
+    with pytest.raises(JsonSourceError) as info:
+        list(multi_source_streamer(json_files[:2] + [str(bad)], processes=processes, max_depth=3))
+
+    assert info.value.source == str(bad)
+    assert isinstance(info.value.__cause__, JsonLimitExceeded)
+
+
+def test_multi_source_rejects_streams_with_processes():
+    with pytest.raises(TypeError):
+        multi_source_streamer([io.BytesIO(b'{}')], processes=True).__next__()
+
+
+def test_multi_source_unpicklable_arguments(json_files):
+    with pytest.raises(JsonSourceError):
+        list(multi_source_streamer(json_files[:1], processes=True, unpicklable=lambda: None))
+
+
+@pytest.mark.parametrize('processes', [False, True])
+def test_multi_source_close_early(json_files, processes):
+    events = multi_source_streamer(json_files, processes=processes, max_workers=2, queue_size=1, batch_size=1)
+    next(events)
+    events.close()